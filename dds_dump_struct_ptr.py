@@ -4,7 +4,7 @@
 import argparse
 import sys
 
-banksize = 0x4000
+from diff_trim import readRom
 
 def getBytes(rom, bank, offset, len):
     offset &= 0x3FFF
@@ -43,14 +43,7 @@ def main():
     if (romtype not in address_map):
         return -1
     
-    with open(romname, 'rb') as f:
-        bank = 0
-        rom = {}
-        data = f.read(banksize)
-        while (data):
-            rom[bank] = data
-            bank += 1
-            data = f.read(banksize)
+    rom = readRom(romname)
         
     num_entries = address_map[romtype]['entries']
     bank        = address_map[romtype]['bank']
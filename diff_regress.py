@@ -0,0 +1,149 @@
+# #!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import difflib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# committed golden logs, ROM images have to be supplied by the user
+games = [
+    {'romtype': 'aka',       'versionA': '10',   'versionB': '11',   'results': 'aka_results',       'debug': '_trimmed_debug.log'},
+    {'romtype': 'kuro',      'versionA': '10',   'versionB': '11',   'results': 'kuro_results',      'debug': '_trimmed-debug.log'},
+    {'romtype': 'mrdriller', 'versionA': 'BMDJ', 'versionB': 'BV3J', 'results': 'mrdriller_results', 'debug': '_trimmed-debug.log'},
+    {'romtype': 'bldp',      'versionA': '10',   'versionB': '00',   'results': 'laura_results',     'debug': '_trimmed-debug.log',
+     'stale': 'committed before the ptradd fix'},
+    ]
+
+# options that must not change the output, the second cached run reads the sidecars back
+passes = [
+    ('plain',              []),
+    ('accelerated',        ['--parallel', '--lru-size', '4096', '--cache', '--lazy', '--bank-hash']),
+    ('accelerated/cached', ['--parallel', '--lru-size', '4096', '--cache', '--lazy', '--bank-hash']),
+    ]
+
+def getGoldenName(game, debug):
+
+    suffix = game['debug'] if debug else '_trimmed.log'
+    return os.path.join(script_dir, game['results'], '{0:s}{1:s}v{2:s}{3:s}'.format(game['romtype'], game['versionA'], game['versionB'], suffix))
+
+def stageInputs(game, rom_dir, work_dir):
+
+    romtype = game['romtype']
+    roms = ['{0:s}{1:s}.gbc'.format(romtype, game[v]) for v in ['versionA', 'versionB']]
+    inputs = [
+        '{0:s}_compare.csv'.format(romtype),
+        '{0:s}_ramshift.csv'.format(romtype),
+        '{0:s}{1:s}_info.txt'.format(romtype, game['versionA']),
+        ]
+    missing = [rom for rom in roms if not os.path.exists(os.path.join(rom_dir, rom))]
+    missing += [name for name in inputs if not os.path.exists(os.path.join(script_dir, name))]
+    if (missing):
+        return missing
+    for rom in roms:
+        shutil.copy(os.path.join(rom_dir, rom), work_dir)
+    for name in inputs:
+        shutil.copy(os.path.join(script_dir, name), work_dir)
+    return []
+
+def runTrim(game, work_dir, debug, flags):
+
+    outname = os.path.join(work_dir, 'trimmed{0:s}.log'.format('-debug' if debug else ''))
+    cmd = [sys.executable, os.path.join(script_dir, 'diff_trim.py')]
+    if (debug):
+        cmd.append('--debug')
+    cmd += [game['romtype'], game['versionA'], game['versionB'], outname] + flags
+    proc = subprocess.run(cmd, cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if (proc.returncode != 0):
+        raise RuntimeError('diff_trim.py failed: {0:s}'.format(proc.stderr.decode('utf-8', 'replace').strip()))
+    return outname
+
+def compareLogs(golden, output):
+
+    with open(golden, 'r') as f:
+        expected = f.read().splitlines()
+    with open(output, 'r') as f:
+        actual = f.read().splitlines()
+    return list(difflib.unified_diff(expected, actual, golden, output, lineterm='', n=1))
+
+def main():
+
+    ap = argparse.ArgumentParser(description='Regenerate the committed trimmed logs and diff them against the golden copies',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--rom-dir', dest='rom_dir', default='.', help='directory holding the <game><version>.gbc ROMs (default: .)')
+    ap.add_argument('--game', dest='games', action='append', default=[], help='only check this ROM type (may be repeated)')
+    ap.add_argument('--max-lines', dest='max_lines', type=int, default=20, help='diff lines shown per failing log (default: 20)')
+    ap.add_argument('--update', dest='update', default=False, help='overwrite the golden logs with the plain run output', action='store_true')
+
+    args = ap.parse_args()
+
+    logging.basicConfig(format='[%(levelname)-8s] %(message)s', level=logging.INFO)
+
+    failures = 0
+    checked = 0
+    expected = 0
+    for game in games:
+        if (args.games and game['romtype'] not in args.games):
+            continue
+        name = '{0:s}{1:s}v{2:s}'.format(game['romtype'], game['versionA'], game['versionB'])
+        work_dir = tempfile.mkdtemp(prefix='diff_regress_')
+        try:
+            missing = stageInputs(game, args.rom_dir, work_dir)
+            if (missing):
+                logging.warning('{0:s}: skipped, missing {1:s}'.format(name, ', '.join(missing)))
+                continue
+            for label, flags in passes:
+                for debug in [False, True]:
+                    golden = getGoldenName(game, debug)
+                    plain = os.path.join(work_dir, 'plain{0:s}.log'.format('-debug' if debug else ''))
+                    checked += 1
+                    try:
+                        output = runTrim(game, work_dir, debug, flags)
+                    except RuntimeError as e:
+                        failures += 1
+                        logging.error('{0:s} {1:s}{2:s}: {3!s}'.format(name, label, ' debug' if debug else '', e))
+                        continue
+                    if (not flags):
+                        shutil.copy(output, plain)
+                    if (args.update and not flags):
+                        shutil.copy(output, golden)
+                        logging.info('{0:s}: updated {1:s}'.format(name, os.path.relpath(golden, script_dir)))
+                        checked -= 1
+                        continue
+                    if ('stale' in game and not args.update):
+                        if (not flags):
+                            # known to differ, report it but don't fail on it
+                            if (compareLogs(golden, output)):
+                                expected += 1
+                                logging.warning('{0:s} {1:s}{2:s}: differs from the golden log as expected ({3:s})'.format(name, label, ' debug' if debug else '', game['stale']))
+                            else:
+                                logging.info('{0:s} {1:s}{2:s}: ok, the golden log is no longer stale'.format(name, label, ' debug' if debug else ''))
+                            continue
+                        # the accelerated runs must still match the plain one
+                        golden = plain
+                    diff = compareLogs(golden, output)
+                    if (not diff):
+                        logging.info('{0:s} {1:s}{2:s}: ok'.format(name, label, ' debug' if debug else ''))
+                        continue
+                    failures += 1
+                    logging.error('{0:s} {1:s}{2:s}: output differs from {3:s}'.format(name, label, ' debug' if debug else '', os.path.relpath(golden, script_dir)))
+                    for line in diff[:args.max_lines]:
+                        logging.error('    {0:s}'.format(line))
+        finally:
+            shutil.rmtree(work_dir)
+
+    if (not checked):
+        # nothing ran, which must not look like a pass
+        logging.error('No logs checked, supply the ROMs with --rom-dir')
+        return 2
+    logging.info('{0:d}/{1:d} logs identical, {2:d} known to differ'.format(checked - failures - expected, checked, expected))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# #!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import json
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from diff_trim import RevisionDiff
+
+def parseAddress(val):
+
+    # BB:AAAA or AAAA for bank 0
+    if (':' in val):
+        bank, ptr = val.split(':', 1)
+        return int(bank, 16), int(ptr, 16)
+    return 0, int(val, 16)
+
+def formatAddress(bank, ptr):
+    return '{0:02X}:{1:04X}'.format(bank, ptr)
+
+def formatRegion(entry):
+
+    region = {key: value for key, value in entry.items() if key not in ['bankA', 'ptrA', 'bankB', 'ptrB', 'bank', 'ptr']}
+    if ('bank' in entry):
+        region['address'] = formatAddress(entry['bank'], entry['ptr'])
+    else:
+        region['addressA'] = formatAddress(entry['bankA'], entry['ptrA'])
+        region['addressB'] = formatAddress(entry['bankB'], entry['ptrB'])
+    return region
+
+class DiffServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, session):
+
+        HTTPServer.__init__(self, address, DiffRequestHandler)
+        self.session = session
+        self.records = {(r['bankA'], r['ptrA']): r for r in session.records}
+
+class DiffRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def sendJson(self, status, body):
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def translate(self, address):
+
+        bank, ptr = parseAddress(address)
+        bankB, ptrB = self.server.session.translate(bank, ptr)
+        return {'address': address, 'translated': formatAddress(bankB, ptrB)}
+
+    def classify(self, address):
+
+        r = self.server.records.get(parseAddress(address))
+        if (r is None):
+            return {'address': address, 'record': False}
+        rule = self.server.session.classify(r)
+        return {
+            'address':     address,
+            'record':      True,
+            'addressB':    formatAddress(r['bankB'], r['ptrB']),
+            'rule':        rule,
+            'interesting': rule is None,
+            }
+
+    def regions(self, query):
+
+        session = self.server.session
+        kind = query.get('type', ['info'])[0]
+        sources = {
+            'info':      session.info,
+            'insertion': session.insertions,
+            'deletion':  session.deletions,
+            'move':      session.moves,
+            }
+        if (kind not in sources):
+            raise ValueError('unknown region type \'{0:s}\''.format(kind))
+        entries = sources[kind]
+        if ('bank' in query):
+            bank = int(query['bank'][0], 16)
+            entries = [e for e in entries if e.get('bank', e.get('bankA')) == bank]
+        return {'type': kind, 'regions': [formatRegion(e) for e in entries]}
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if (url.path == '/translate'):
+                self.sendJson(200, self.translate(query['address'][0]))
+            elif (url.path == '/classify'):
+                self.sendJson(200, self.classify(query['address'][0]))
+            elif (url.path == '/regions'):
+                self.sendJson(200, self.regions(query))
+            else:
+                self.sendJson(404, {'error': 'unknown endpoint \'{0:s}\''.format(url.path)})
+        except (KeyError, ValueError) as e:
+            self.sendJson(400, {'error': str(e)})
+
+    def do_POST(self):
+
+        # batch queries: {"addresses": ["02:58C3", ...]}
+        url = urlparse(self.path)
+        handlers = {'/translate': self.translate, '/classify': self.classify}
+        if (url.path not in handlers):
+            self.sendJson(404, {'error': 'unknown endpoint \'{0:s}\''.format(url.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            addresses = body.get('addresses') if isinstance(body, dict) else None
+            if (not isinstance(addresses, list) or not all(isinstance(a, str) for a in addresses)):
+                self.sendJson(400, {'error': '\'addresses\' must be a list of address strings'})
+                return
+            results = []
+            for address in addresses:
+                try:
+                    results.append(handlers[url.path](address))
+                except ValueError as e:
+                    results.append({'address': address, 'error': str(e)})
+            self.sendJson(200, {'results': results})
+        except (KeyError, ValueError, TypeError) as e:
+            self.sendJson(400, {'error': str(e)})
+
+def main():
+
+    ap = argparse.ArgumentParser(description='Serve address translation and record classification for a loaded revision comparison',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--debug', dest='debug', default=False, help='print debug output', action='store_true')
+    ap.add_argument('--host', dest='host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    ap.add_argument('--port', dest='port', type=int, default=8040, help='port to listen on (default: 8040)')
+    ap.add_argument('--cache', dest='cache', default=False, help='use binary .cache sidecars for info and compare files', action='store_true')
+    ap.add_argument('--lru-size', dest='lru_size', type=int, default=4096, help='memoize up to N shift lookups each and info lookups per region (default: 4096)')
+    ap.add_argument('--lazy', dest='lazy', default=False, help='read ROM banks only when they are first accessed', action='store_true')
+    ap.add_argument('--moves', dest='moves', default=False, help='detect blocks moved between deletions and insertions', action='store_true')
+    ap.add_argument('--move-window', dest='move_window', type=int, default=16, help='minimum size of moved blocks (default: 16)')
+    ap.add_argument('romtype', help='ROM type: aka, kuro')
+    ap.add_argument('versionA', help='ROM A version string')
+    ap.add_argument('versionB', help='ROM B version string')
+
+    args = ap.parse_args()
+
+    loglevel = logging.DEBUG if args.debug else logging.WARNING
+    logging.basicConfig(format='[%(levelname)-8s] %(message)s', level=loglevel)
+
+    session = RevisionDiff.fromFiles(args.romtype, args.versionA, args.versionB, args.cache, None, args.lru_size, args.lazy)
+    if (args.moves):
+        session.findMoves(args.move_window)
+
+    server = DiffServer((args.host, args.port), session)
+    print('Serving {0:s}{1:s} vs {0:s}{2:s} on http://{3:s}:{4:d}/'.format(args.romtype, args.versionA, args.versionB, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,11 +7,7 @@ import sys
 from re import compile
 import logging
 
-def parseHex(val):
-    val = val[:-1] # cut off h
-    if (val is not ''):
-        return int(val, 16)
-    return -1
+from diff_trim import parseHex
 
 def main():
 
@@ -3,11 +3,25 @@
 
 import argparse
 import csv
+import hashlib
+import json
+import mmap
+import os
 import sys
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from re import compile
+from struct import Struct
 import logging
 
 banksize = 0x4000
+blocksize = 0x100
+
+# run statistics go to the console, the log file only holds the trimmed diff
+perf = logging.getLogger('diff_trim.perf')
 
 def getBank(address):
     return address // banksize
@@ -20,7 +34,73 @@ def getPointer(address):
         return pnt
     return pnt | 0x4000
 
-def readRom(path):
+def getAddress(bank, ptr):
+    
+    if (ptr < 0x4000):
+        return ptr
+    return bank * banksize + (ptr & 0x3FFF)
+
+def getPairName(romtype, versionA, versionB, kind):
+    return '{0:s}{1:s}v{2:s}_{3:s}.csv'.format(romtype, versionA, versionB, kind)
+
+def getPairFile(romtype, versionA, versionB, kind):
+    
+    # chains need one compare/ramshift file per revision pair, single
+    # comparisons keep using the per-game file
+    pairname = getPairName(romtype, versionA, versionB, kind)
+    if (os.path.exists(pairname)):
+        return pairname
+    return '{0:s}_{1:s}.csv'.format(romtype, kind)
+
+class LazyRom:
+    """Banks of a ROM file, each read the first time it is accessed.
+    
+    Behaves like the bank dict returned by readRom, but banks that are never
+    touched are never read from disk.
+    """
+    
+    def __init__(self, path):
+        
+        self.path = path
+        self.count = (os.path.getsize(path) + banksize - 1) // banksize
+        self.banks = {}
+    
+    def __getitem__(self, bank):
+        
+        data = self.banks.get(bank)
+        if (data is None):
+            if (not isinstance(bank, int) or not (0 <= bank < self.count)):
+                raise KeyError(bank)
+            with open(self.path, 'rb') as f:
+                f.seek(bank * banksize)
+                data = f.read(banksize)
+            self.banks[bank] = data
+        return data
+    
+    def __contains__(self, bank):
+        return isinstance(bank, int) and 0 <= bank < self.count
+    
+    def __len__(self):
+        return self.count
+    
+    def __iter__(self):
+        return iter(range(self.count))
+    
+    def get(self, bank, default=None):
+        return self[bank] if bank in self else default
+    
+    def keys(self):
+        return list(range(self.count))
+    
+    def values(self):
+        return [self[bank] for bank in range(self.count)]
+    
+    def items(self):
+        return [(bank, self[bank]) for bank in range(self.count)]
+
+def readRom(path, lazy=False):
+    if (lazy):
+        return LazyRom(path)
     rom = {}
     with open(path, 'rb') as f:
         bank = 0
@@ -33,54 +113,10 @@ def readRom(path):
     
 def parseHex(val):
     val = val[:-1] # cut off h
-    if (val is not ''):
+    if (val != ''):
         return int(val, 16)
     return -1
 
-def sumShifts(shifts, bank, ptr):
-    
-    loc_bank = bank if ptr >= 0x4000 else 0x00
-    shift = 0
-    for s in shifts:
-        if (s['bankA'] > loc_bank) or \
-           (s['bankA'] == loc_bank and s['ptrA'] > ptr):
-            break
-        
-        shift += s['shift']
-
-    return shift
-
-def sumRamShifts(shifts, bank, ptr):
-    
-    shift = 0
-    for s in shifts:
-        if (s['bank'] > bank) or \
-           (s['bank'] == bank and s['ptr'] > ptr):
-            break
-
-        shift += s['shift']
-
-    return shift
-
-def isRamRemap(switches, ptrA, ptrB):
-    
-    for s in switches:
-        if (ptrA == s['ptrA'] and ptrB == s['ptrB']):
-            return True
-    
-    return False
-    
-def getInfo(info, bank, ptr):
-    
-    for i in info:
-        if i['bank'] != bank:
-            continue
-        if i['ptr'] > ptr or i['ptr'] + i['len'] < ptr:
-            continue
-        return i
-    
-    return {'type': None}
-
 def getByte(rom, bank, ptr, offset):
     ptr &= 0x3FFF
     if (0 > (ptr + offset)):
@@ -96,110 +132,293 @@ def getBytes(romA, romB, record, offset):
     return getByte(romA, record['bankA'], record['ptrA'], offset), \
            getByte(romB, record['bankB'], record['ptrB'], offset)
 
-def main():
-
-    ap = argparse.ArgumentParser(description='Filter out bogus diffs from revision comparisons by tracking address shifts',
-                                 formatter_class=argparse.RawTextHelpFormatter)
-    ap.add_argument('--debug', dest='debug', default=False, help='print debug output', action='store_true')
-    ap.add_argument('romtype', help='ROM type: aka, kuro')
-    ap.add_argument('versionA', help='ROM A version string')
-    ap.add_argument('versionB', help='ROM B version string')
-    ap.add_argument('outfile', nargs='?', help='path to trimmed output diff file')
-
-    args = ap.parse_args()
-    debug = args.debug
-    romtype = args.romtype
-    outname = args.outfile
-    versionA = args.versionA
-    versionB = args.versionB
+def buildShiftIndex(shifts, bankKey='bankA', ptrKey='ptrA'):
     
-    if outname is None:
-        outname = '{0:s}{2:s}v{3:s}_trimmed{1:s}.log'.format(romtype, '-debug' if debug else '', versionA, versionB)
+    # summing shifts in order stops at the first one past the queried
+    # location, so keep a running maximum of the keys to bisect on instead
+    keys = []
+    sums = [0]
+    top = None
+    for s in shifts:
+        key = (s[bankKey], s[ptrKey])
+        if (top is None or key > top):
+            top = key
+        keys.append(top)
+        sums.append(sums[-1] + s['shift'])
     
-    romnameA = '{0:s}{1:s}.gbc'.format(romtype, versionA)
-    romnameB = '{0:s}{1:s}.gbc'.format(romtype, versionB)
-    csvname = '{0:s}_compare.csv'.format(romtype)
-    infoname = '{0:s}{1:s}_info.txt'.format(romtype, versionA)
-    ramshiftname = '{0:s}_ramshift.csv'.format(romtype)
+    return {'keys': keys, 'sums': sums}
 
-    loglevel = logging.DEBUG if debug else logging.INFO
-    logging.basicConfig(format='[%(levelname)-8s] %(message)s', level=loglevel, filename=outname, filemode='w')
+def lookupShift(index, bank, ptr):
+    
+    loc_bank = bank if ptr >= 0x4000 else 0x00
+    return index['sums'][bisect_right(index['keys'], (loc_bank, ptr))]
 
-    romA = readRom(romnameA)
-    romB = readRom(romnameB)
+def shiftBreakpoints(shifts, bankKey='bankA', ptrKey='ptrA'):
 
-    byte_pat = '[0-9A-Fa-f]{2}'
-    ptr_pat = '{0}{0}'.format(byte_pat)
-    code_regex = compile('^ *({0}) ({0}):({1}) ({0}):({1})$'.format(byte_pat, ptr_pat))
-    ptrtbl_regex = compile('^ *([lhb]{{2,3}}) ({0}) ({0}):({1}) ({0}):({1})$'.format(byte_pat, ptr_pat))
-    ptradd_regex = compile('^ *(\w+) ({0}) ({0}):({1}) ({0}):({1})$'.format(byte_pat, ptr_pat))
-    info = []
-    with open(infoname, 'r') as f:
-        for line in f:
-            cmd, args = line.strip().split(' ', 1)
-            if (cmd == 'code'):
-                m = code_regex.match(args)
-                if (m is None):
-                    logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
-                    continue
-                bank = int(m.group(1), 16)
-                start = int(m.group(2), 16) * banksize + (int(m.group(3), 16) & 0x3FFF)
-                end = int(m.group(4), 16) * banksize + (int(m.group(5), 16) & 0x3FFF)
-                info.append({
-                    'type':    cmd,
-                    'bank':    getBank(start),
-                    'ptr' :    getPointer(start),
-                    'refBank': bank,
-                    'len' :    end - start
-                    }
-                )
-            elif (cmd == 'ptrtbl'):
-                m = ptrtbl_regex.match(args)
+    # linear addresses where the total shift changes, with the total from there on
+    index = buildShiftIndex(shifts, bankKey, ptrKey)
+    points = []
+    for (bank, ptr), total in zip(index['keys'], index['sums'][1:]):
+        address = getAddress(bank, ptr)
+        if (points and points[-1][0] == address):
+            points[-1] = (address, total)
+        else:
+            points.append((address, total))
+    return points
+
+def composeShifts(shiftsAB, shiftsBC):
+
+    # walk the A->B segments in order, each one maps to a B range that
+    # crosses the B->C breakpoints in order too, so both lists are read once
+    # (deletions can make B ranges overlap, the B pointer only backs up over those)
+    first = shiftBreakpoints(shiftsAB)
+    second = shiftBreakpoints(shiftsBC)
+    segments = [(0, 0)] + first
+    points = []
+    j = 0
+    for ix, (start, total) in enumerate(segments):
+        end = segments[ix + 1][0] if ix + 1 < len(segments) else None
+        startB = start + total
+        while (j > 0 and second[j - 1][0] > startB):
+            j -= 1
+        while (j < len(second) and second[j][0] <= startB):
+            j += 1
+        points.append((start, total + (second[j - 1][1] if j else 0)))
+        while (j < len(second) and (end is None or second[j][0] - total < end)):
+            points.append((second[j][0] - total, total + second[j][1]))
+            j += 1
+
+    shifts = []
+    current = 0
+    for address, total in points:
+        if (total == current):
+            continue
+        target = address + total
+        shifts.append({
+            'bankA': getBank(address),
+            'ptrA' : getPointer(address),
+            'bankB': getBank(target),
+            'ptrB' : getPointer(target),
+            'shift': total - current,
+            }
+        )
+        current = total
+    return shifts
+
+sym_regex = compile(r'^\s*([0-9A-Fa-f]{1,2}):([0-9A-Fa-f]{4})\s+(\S+)')
+map_bank_regex = compile(r'^\s*(\w+) bank #(\d+):')
+map_sym_regex = compile(r'^\s*\$([0-9A-Fa-f]{4}) = (\S+)')
+
+def loadSymbols(path):
+    
+    symbols = []
+    with open(path, 'r') as f:
+        if (not path.endswith('.map')):
+            # RGBDS .sym: BB:AAAA Label
+            for line in f:
+                m = sym_regex.match(line)
                 if (m is None):
-                    logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
                     continue
-                fmt = m.group(1)
-                for fmt_char in ['l', 'h', 'b']:
-                    if (fmt.count(fmt_char) > 1 or (fmt_char != 'b' and fmt.count(fmt_char) != 1)):
-                        logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
-                        continue
-                bank = int(m.group(2), 16)
-                start = int(m.group(3), 16) * banksize + (int(m.group(4), 16) & 0x3FFF)
-                end = int(m.group(5), 16) * banksize + (int(m.group(6), 16) & 0x3FFF)
-                info.append({
-                    'type':    cmd,
-                    'fmt':     fmt,
-                    'bank':    getBank(start),
-                    'ptr' :    getPointer(start),
-                    'refBank': bank,
-                    'len' :    end - start
+                symbols.append({
+                    'bank': int(m.group(1), 16),
+                    'ptr' : int(m.group(2), 16),
+                    'name': m.group(3),
                     }
                 )
-            elif (cmd == 'ptradd'):
-                m = ptradd_regex.match(args)
-                if (m is None):
-                    logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
+        else:
+            # RGBDS .map: labels are listed below their bank header
+            bank = None
+            for line in f:
+                m = map_bank_regex.match(line)
+                if (m is not None):
+                    bank = int(m.group(2))
                     continue
-                kind = m.group(1)
-                if (kind not in ['simple']):
-                    logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
+                m = map_sym_regex.match(line)
+                if (m is None or bank is None):
                     continue
-                bank = int(m.group(2), 16)
-                start = int(m.group(3), 16) * banksize + (int(m.group(4), 16) & 0x3FFF)
-                end = int(m.group(5), 16) * banksize + (int(m.group(6), 16) & 0x3FFF)
-                info.append({
-                    'type':    cmd,
-                    'kind':    kind,
-                    'bank':    getBank(start),
-                    'ptr' :    getPointer(start),
-                    'refBank': bank,
-                    'len' :    end - start
+                symbols.append({
+                    'bank': bank,
+                    'ptr' : int(m.group(1), 16),
+                    'name': m.group(2),
                     }
                 )
-            else:
-                logging.warning('Unknown info entry \'{0:s}\'. Skipping...'.format(line))
+    
+    return symbols
+
+def buildSymbolBanks(symbols):
+    
+    sym_banks = {}
+    for s in symbols:
+        if (0 == s['bank'] or not (0x4000 <= s['ptr'] < 0x8000)):
+            continue
+        banks = sym_banks.setdefault(s['ptr'], [])
+        if (s['bank'] not in banks):
+            banks.append(s['bank'])
+    
+    return sym_banks
+
+def getSymbolBank(sym_banks, ptr):
+    
+    banks = sym_banks.get(ptr, [])
+    if (len(banks) == 1):
+        return banks[0]
+    return None
+
+def translateSymbols(symbols, translate):
+    
+    # translate is RevisionDiff.translate, so moves and RAM remaps apply too
+    translated = []
+    for s in symbols:
+        bank, ptr = translate(s['bank'], s['ptr'])
+        translated.append({'bank': bank, 'ptr': ptr, 'name': s['name']})
+    
+    return translated
+
+def translateInfo(info, translate):
+    
+    # carry info entries over to ROM B, regions grow or shrink with the
+    # insertions and deletions inside them
+    translated = []
+    for i in info:
+        start = getAddress(i['bank'], i['ptr'])
+        end = start + i['len']
+        bank, ptr = translate(i['bank'], i['ptr'])
+        endBank, endPtr = translate(getBank(end), getPointer(end))
+        entry = dict(i)
+        entry['bank'] = bank
+        entry['ptr'] = ptr
+        entry['len'] = max(0, getAddress(endBank, endPtr) - getAddress(bank, ptr))
+        translated.append(entry)
+    
+    return translated
+
+# first line of every symbol file this script writes, other files are never touched
+sym_header = '; translated by diff_trim.py'
+
+def getSymbolsName(romtype, versionA, versionB):
+    return '{0:s}{1:s}v{2:s}_translated.sym'.format(romtype, versionA, versionB)
+
+def isOwnSymbols(path):
+    
+    with open(path, 'r') as f:
+        return f.readline().startswith(sym_header)
+
+def getSymbolsDigest(sources, move_window):
+    
+    # the moves found depend on the window and on both ROMs, which are among the sources
+    digest = hashlib.sha1('move_window={0:d}'.format(move_window).encode('ascii'))
+    for src in sources:
+        digest.update(sourceDigest(src))
+    return digest.hexdigest()
+
+def isUpToDate(path, digest):
+    
+    if (not os.path.exists(path)):
+        return False
+    with open(path, 'r') as f:
+        return f.readline().rstrip('\n') == '{0:s} {1:s}'.format(sym_header, digest)
+
+def writeSymbols(path, symbols, digest):
+    
+    with open(path, 'w') as f:
+        f.write('{0:s} {1:s}\n'.format(sym_header, digest))
+        for s in symbols:
+            f.write('{0:02X}:{1:04X} {2:s}\n'.format(s['bank'], s['ptr'], s['name']))
+
+byte_pat = '[0-9A-Fa-f]{2}'
+ptr_pat = '{0}{0}'.format(byte_pat)
+code_regex = compile('^ *({0}) ({0}):({1}) ({0}):({1})$'.format(byte_pat, ptr_pat))
+ptrtbl_regex = compile('^ *([lhb]{{2,3}}) ({0}) ({0}):({1}) ({0}):({1})$'.format(byte_pat, ptr_pat))
+ptradd_regex = compile(r'^ *(\w+) ({0}) ({0}):({1}) ({0}):({1})$'.format(byte_pat, ptr_pat))
+
+def parseInfoLine(line):
+
+    clean = True
+    cmd, args = line.strip().split(' ', 1)
+    if (cmd == 'code'):
+        m = code_regex.match(args)
+        if (m is None):
+            clean = False
+            logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
+            return None, clean
+        bank = int(m.group(1), 16)
+        start = int(m.group(2), 16) * banksize + (int(m.group(3), 16) & 0x3FFF)
+        end = int(m.group(4), 16) * banksize + (int(m.group(5), 16) & 0x3FFF)
+        entry = {
+            'type':    cmd,
+            'bank':    getBank(start),
+            'ptr' :    getPointer(start),
+            'refBank': bank,
+            'len' :    end - start
+            }
+    elif (cmd == 'ptrtbl'):
+        m = ptrtbl_regex.match(args)
+        if (m is None):
+            clean = False
+            logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
+            return None, clean
+        fmt = m.group(1)
+        for fmt_char in ['l', 'h', 'b']:
+            if (fmt.count(fmt_char) > 1 or (fmt_char != 'b' and fmt.count(fmt_char) != 1)):
+                clean = False
+                logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
                 continue
+        bank = int(m.group(2), 16)
+        start = int(m.group(3), 16) * banksize + (int(m.group(4), 16) & 0x3FFF)
+        end = int(m.group(5), 16) * banksize + (int(m.group(6), 16) & 0x3FFF)
+        entry = {
+            'type':    cmd,
+            'fmt':     fmt,
+            'bank':    getBank(start),
+            'ptr' :    getPointer(start),
+            'refBank': bank,
+            'len' :    end - start
+            }
+    elif (cmd == 'ptradd'):
+        m = ptradd_regex.match(args)
+        if (m is None):
+            clean = False
+            logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
+            return None, clean
+        kind = m.group(1)
+        if (kind not in ['simple']):
+            clean = False
+            logging.warning('Malformed info entry \'{0:s}\'. Skipping...'.format(line))
+            return None, clean
+        bank = int(m.group(2), 16)
+        start = int(m.group(3), 16) * banksize + (int(m.group(4), 16) & 0x3FFF)
+        end = int(m.group(5), 16) * banksize + (int(m.group(6), 16) & 0x3FFF)
+        entry = {
+            'type':    cmd,
+            'kind':    kind,
+            'bank':    getBank(start),
+            'ptr' :    getPointer(start),
+            'refBank': bank,
+            'len' :    end - start
+            }
+    else:
+        clean = False
+        logging.warning('Unknown info entry \'{0:s}\'. Skipping...'.format(line))
+        return None, clean
+
+    return entry, clean
+
+def parseInfo(infoname):
+
+    clean = True
+    info = []
+    with open(infoname, 'r') as f:
+        for line in f:
+            entry, line_clean = parseInfoLine(line)
+            clean = clean and line_clean
+            if (entry is not None):
+                info.append(entry)
 
+    return info, clean
+
+def parseCompare(csvname):
+
+    clean = True
     with open(csvname, 'r', newline='') as csvfile:
         csvr = csv.reader(csvfile, dialect='excel')
         records = []
@@ -298,8 +517,13 @@ def main():
                     }
                 )
             else:
+                clean = False
                 logging.warning('Unknown comparison type \'{0:s}\'!'.format(row[0]))
 
+    return records, shifts, insertions, deletions, clean
+
+def parseRamShifts(ramshiftname):
+
     with open(ramshiftname, 'r', newline='') as csvfile:
         csvr = csv.reader(csvfile, dialect='excel')
         ram_shifts  = []
@@ -349,35 +573,746 @@ def main():
             else:
                 logging.warning('Unknown comparison type \'{0:s}\'!'.format(row[0]))
 
-    # print shifts:
-    shift = 0
+    return ram_shifts, ram_deletions, ram_switches
+
+# binary sidecar caches: header followed by fixed-width records
+cache_magic = b'DTC1'
+cache_header = Struct('<4s20sI')
+info_record = Struct('<B3sBiiii')
+compare_record = Struct('<Biiiiii')
+info_types = ['code', 'ptrtbl', 'ptradd']
+info_kinds = ['', 'simple']
+
+def sourceDigest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+def readCache(path, digest, record):
+    
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+    with f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return None
+        with mm:
+            if (len(mm) < cache_header.size):
+                return None
+            magic, src_digest, count = cache_header.unpack_from(mm, 0)
+            if (magic != cache_magic or src_digest != digest or \
+                len(mm) != cache_header.size + count * record.size):
+                return None
+            return list(record.iter_unpack(mm[cache_header.size:]))
+
+def writeCache(path, digest, record, rows):
+    
+    with open(path, 'wb') as f:
+        f.write(cache_header.pack(cache_magic, digest, len(rows)))
+        for row in rows:
+            f.write(record.pack(*row))
+
+def encodeInfo(i):
+    return (
+        info_types.index(i['type']),
+        i.get('fmt', '').encode('ascii'),
+        info_kinds.index(i.get('kind', '')),
+        i['bank'],
+        i['ptr'],
+        i['refBank'],
+        i['len']
+        )
+
+def decodeInfo(row):
+    
+    type, fmt, kind, bank, ptr, refBank, len = row
+    i = {
+        'type':    info_types[type],
+        'bank':    bank,
+        'ptr' :    ptr,
+        'refBank': refBank,
+        'len' :    len
+        }
+    if (i['type'] == 'ptrtbl'):
+        i['fmt'] = fmt.rstrip(b'\x00').decode('ascii')
+    elif (i['type'] == 'ptradd'):
+        i['kind'] = info_kinds[kind]
+    return i
+
+def loadInfo(infoname, cache=False):
+    
+    if (cache):
+        cachename = infoname + '.cache'
+        digest = sourceDigest(infoname)
+        rows = readCache(cachename, digest, info_record)
+        if (rows is not None):
+            return [decodeInfo(row) for row in rows]
+    
+    info, clean = parseInfo(infoname)
+    
+    # only cache files that parse without warnings, so cached runs log the same
+    if (cache and clean):
+        writeCache(cachename, digest, info_record, [encodeInfo(i) for i in info])
+    
+    return info
+
+def loadCompare(csvname, cache=False):
+    
+    if (cache):
+        cachename = csvname + '.cache'
+        digest = sourceDigest(csvname)
+        rows = readCache(cachename, digest, compare_record)
+        if (rows is not None):
+            lists = ([], [], [], [])
+            for tag, bankA, ptrA, bankB, ptrB, a, b in rows:
+                e = {'bankA': bankA, 'ptrA': ptrA, 'bankB': bankB, 'ptrB': ptrB}
+                if (tag == 0):
+                    e['lenA'] = a
+                    e['lenB'] = b
+                elif (tag == 1):
+                    e['shift'] = a
+                else:
+                    e['len'] = a
+                lists[tag].append(e)
+            return lists
+    
+    records, shifts, insertions, deletions, clean = parseCompare(csvname)
+    
+    if (cache and clean):
+        rows = []
+        for r in records:
+            rows.append((0, r['bankA'], r['ptrA'], r['bankB'], r['ptrB'], r['lenA'], r['lenB']))
+        for s in shifts:
+            rows.append((1, s['bankA'], s['ptrA'], s['bankB'], s['ptrB'], s['shift'], 0))
+        for tag, entries in [(2, insertions), (3, deletions)]:
+            for e in entries:
+                rows.append((tag, e['bankA'], e['ptrA'], e['bankB'], e['ptrB'], e['len'], 0))
+        writeCache(cachename, digest, compare_record, rows)
+    
+    return records, shifts, insertions, deletions
+
+def hashBank(data):
+    return hashlib.sha1(data).digest()
+
+def hashRoms(romA, romB, jobs=None):
+    
+    # hashlib releases the GIL on large buffers, so threads hash banks in parallel
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        hashesA = dict(zip(romA.keys(), pool.map(hashBank, romA.values())))
+        hashesB = dict(zip(romB.keys(), pool.map(hashBank, romB.values())))
+    return hashesA, hashesB
+
+def classifyBanks(romA, romB, shifts, jobs=None):
+    
+    hashesA, hashesB = hashRoms(romA, romB, jobs)
+    shift_index = buildShiftIndex(shifts)
+    
+    # banks with shift entries past their first byte don't have a single shift
+    varying = set()
     for s in shifts:
-        logging.debug('Shift: {0:02X}:{1:04X} -- {2:d} --> {3:d}'.format(s['bankA'], s['ptrA'], shift, shift + s['shift']))
-        shift += s['shift']
+        if (s['ptrA'] & 0x3FFF):
+            varying.add(s['bankA'])
+    
+    banks = {}
+    for bank, digestA in hashesA.items():
+        if (bank not in hashesB):
+            banks[bank] = {'state': 'removed'}
+            continue
+        start = 0x4000 if bank else 0x0000
+        shift = lookupShift(shift_index, bank, start)
+        # compare linear ranges, so bytes shifted across the bank
+        # boundary are checked against the neighbouring B bank too
+        address = getAddress(bank, start)
+        dataA = romA[bank]
+        if (bank not in varying and abs(shift) < banksize):
+            if (not shift and digestA == hashesB[bank]):
+                banks[bank] = {'state': 'identical'}
+                continue
+            if (shift and getRange(romB, address + shift, len(dataA)) == dataA):
+                banks[bank] = {'state': 'shifted', 'shift': shift}
+                continue
+        # each block is compared where its own first byte moved to in B
+        changed = []
+        for o in range(0, len(dataA), blocksize):
+            blockShift = lookupShift(shift_index, bank, start + o)
+            block = dataA[o:o + blocksize]
+            if (getRange(romB, address + o + blockShift, len(block)) != block):
+                changed.append(o // blocksize)
+        banks[bank] = {'state': 'changed', 'blocks': changed}
+    for bank in hashesB:
+        if (bank not in hashesA):
+            banks[bank] = {'state': 'added'}
+    
+    return banks
+
+hash_base = 257
+hash_mod = (1 << 61) - 1
+
+def rollingHashes(data, window):
+    
+    if (len(data) < window):
+        return
+    h = 0
+    for b in data[:window]:
+        h = (h * hash_base + b) % hash_mod
+    yield 0, h
+    top = pow(hash_base, window - 1, hash_mod)
+    for ix in range(window, len(data)):
+        h = ((h - data[ix - window] * top) * hash_base + data[ix]) % hash_mod
+        yield ix - window + 1, h
+
+def getRange(rom, address, length):
+    
+    data = b''
+    while (length > 0):
+        bank = getBank(address)
+        if (bank not in rom):
+            break
+        offset = address % banksize
+        chunk = rom[bank][offset:offset + length]
+        if (not chunk):
+            break
+        data += chunk
+        address += len(chunk)
+        length -= len(chunk)
+    return data
 
+def detectMoves(romA, romB, deletions, insertions, window):
+    
+    # index every window of inserted B data by its rolling hash
+    targets = {}
+    regionsB = []
     for i in insertions:
-        logging.debug('Insertion: {0:02X}:{1:04X} -- -{2:d}'.format(i['bankA'], i['ptrA'], i['len']))
-        
+        start = getAddress(i['bankB'], i['ptrB'])
+        data = getRange(romB, start, i['len'])
+        regionsB.append((start, data))
+        for ix, h in rollingHashes(data, window):
+            targets.setdefault(h, []).append((len(regionsB) - 1, ix))
+    
+    # slide over deleted A data and extend every verified hit
+    moves = []
     for d in deletions:
-        logging.debug('Deletion: {0:02X}:{1:04X} -- -{2:d}'.format(d['bankA'], d['ptrA'], d['len']))
+        start = getAddress(d['bankA'], d['ptrA'])
+        data = getRange(romA, start, d['len'])
+        next_free = 0
+        for ix, h in rollingHashes(data, window):
+            if (ix < next_free or h not in targets):
+                continue
+            for region, offset in targets[h]:
+                startB, dataB = regionsB[region]
+                if (data[ix:ix + window] != dataB[offset:offset + window]):
+                    continue
+                length = window
+                while (ix + length < len(data) and offset + length < len(dataB) and \
+                       data[ix + length] == dataB[offset + length]):
+                    length += 1
+                addrA = start + ix
+                addrB = startB + offset
+                moves.append({
+                    'bankA': getBank(addrA),
+                    'ptrA' : getPointer(addrA),
+                    'bankB': getBank(addrB),
+                    'ptrB' : getPointer(addrB),
+                    'len'  : length
+                    }
+                )
+                next_free = ix + length
+                break
+    
+    moves.sort(key=lambda m: getAddress(m['bankA'], m['ptrA']))
+    return moves
 
-    shift = 0
-    for s in ram_shifts:
-        logging.debug('RAM Shift: {0:02X}:{1:04X} -- {2:d} --> {3:d}'.format(s['bank'], s['ptr'], shift, shift + s['shift']))
-        shift += s['shift']
+def isCovered(entry, bankKey, ptrKey, moves):
+    
+    start = getAddress(entry[bankKey], entry[ptrKey])
+    end = start + entry['len']
+    for m in moves:
+        startM = getAddress(m[bankKey], m[ptrKey])
+        if (startM <= start and end <= startM + m['len']):
+            return True
+    return False
 
-    for d in ram_deletions:
-        logging.debug('RAM Deletion: {0:02X}:{1:04X} -- -{2:d}'.format(d['bank'], d['ptr'], d['len']))
+def findMove(moves, starts, address):
+    
+    # starts holds the A addresses of the sorted moves
+    ix = bisect_right(starts, address) - 1
+    if (ix < 0 or address - starts[ix] >= moves[ix]['len']):
+        return None
+    return moves[ix]
 
-    # print infos:
-    for i in info:
-        logging.debug('Info: {0:02X}:{1:04X} -- {2:d} bytes ref bank {3:02X}'.format(i['bank'], i['ptr'], i['len'], i['refBank']))
+def isMoved(moves, starts, bank, ptrA, ptrB):
+    
+    address = getAddress(bank, ptrA)
+    m = findMove(moves, starts, address)
+    if (m is None):
+        return False
+    offset = address - getAddress(m['bankA'], m['ptrA'])
+    target = getPointer(getAddress(m['bankB'], m['ptrB']) + offset)
+    logging.debug('    move: {0:02X}:{1:04X} --> {2:04X}'.format(m['bankA'], m['ptrA'], target))
+    return target == ptrB
+
+def timed(fn, args):
+    
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def loadStages(stages, jobs=None):
+    
+    start = time.perf_counter()
+    if (jobs == 1):
+        timings = [timed(fn, args) for name, fn, args, background in stages]
+    else:
+        # silent stages like ROM reads overlap on threads, the ones that log
+        # warnings run here one after the other so their output keeps its order
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(timed, fn, args) if background else None for name, fn, args, background in stages]
+            timings = [None if background else timed(fn, args) for name, fn, args, background in stages]
+            timings = [t if f is None else f.result() for f, t in zip(futures, timings)]
+    wall = time.perf_counter() - start
+    
+    results = {}
+    total = 0.0
+    for (name, fn, args, background), (result, duration) in zip(stages, timings):
+        perf.debug('Stage {0:s}: {1:.3f}s'.format(name, duration))
+        results[name] = result
+        total += duration
+    perf.debug('Loading: {0:.3f}s of stages in {1:.3f}s wall time, {2:.3f}s saved'.format(total, wall, total - wall))
+    
+    return results
+
+# instruction lengths of the SM83 opcodes, 0xCB prefixed ones are all 2 bytes
+op_lengths = [1] * 0x100
+for op in [0x06, 0x0E, 0x10, 0x16, 0x18, 0x1E, 0x20, 0x26, 0x28, 0x2E, 0x30, 0x36, 0x38, 0x3E,
+           0xC6, 0xCB, 0xCE, 0xD6, 0xDE, 0xE0, 0xE6, 0xE8, 0xEE, 0xF0, 0xF6, 0xF8, 0xFE]:
+    op_lengths[op] = 2
+for op in [0x01, 0x08, 0x11, 0x21, 0x31, 0xC2, 0xC3, 0xC4, 0xCA, 0xCC, 0xCD, 0xD2, 0xD4, 0xDA, 0xDC, 0xEA, 0xFA]:
+    op_lengths[op] = 3
+
+# jumps, calls, returns and rsts end a basic block
+block_ends = {0x18, 0x20, 0x28, 0x30, 0x38, 0xC0, 0xC2, 0xC3, 0xC4, 0xC8, 0xC9, 0xCA, 0xCC, 0xCD,
+              0xD0, 0xD2, 0xD4, 0xD8, 0xD9, 0xDA, 0xDC, 0xE9} | {0xC7 + 8 * n for n in range(8)}
+# instructions that leave a, b, c, d, e, h and l untouched
+keeps_regs = {0x00, 0x02, 0x12, 0x36, 0x70, 0x71, 0x72, 0x73, 0x74, 0x75, 0x77, 0xE0, 0xE2, 0xEA}
+reg_names = ['b', 'c', 'd', 'e', 'h', 'l', None, 'a']
+reg_pairs = [('b', 'c'), ('d', 'e'), ('h', 'l')]
+dataflow_lookback = 16
+dataflow_lookahead = 16
 
-    records_filtered = []
-    for ix, r in enumerate(records):
+def findBlockStarts(data, op_pos):
+    
+    # every start that decodes onto op_pos without crossing a block end;
+    # data in front of the block can make several of them look valid
+    starts = []
+    for start in range(max(0, op_pos - dataflow_lookback), op_pos + 1):
+        pos = start
+        while (pos < op_pos and data[pos] not in block_ends):
+            pos += op_lengths[data[pos]]
+        if (pos == op_pos):
+            starts.append(start)
+    return starts
+
+def simulateBlock(data, start, imm_pos, pairs):
+    
+    regs = {}
+    stores = []
+    pos = start
+    # blocks near the end of a bank run into it before the lookahead ends
+    while (pos <= imm_pos + dataflow_lookahead and pos < len(data)):
+        op = data[pos]
+        length = op_lengths[op]
+        if (pos + length > len(data)):
+            break
+        if (op & 0xC7 == 0x06 and op != 0x36):
+            # ld r,n
+            regs[reg_names[op >> 3]] = (data[pos + 1], pos + 1)
+        elif (0x40 <= op < 0x80 and op != 0x76 and (op >> 3) & 7 != 6):
+            # ld r,r'
+            dst = reg_names[(op >> 3) & 7]
+            src = reg_names[op & 7]
+            if (src in regs):
+                regs[dst] = regs[src]
+            else:
+                regs.pop(dst, None)
+        elif (op == 0x22):
+            # ld [hl+],a
+            stores.append(regs.get('a'))
+            regs.pop('h', None)
+            regs.pop('l', None)
+        elif (op not in keeps_regs):
+            regs.clear()
+        
+        for hi, lo in reg_pairs:
+            if (hi not in regs or lo not in regs):
+                continue
+            (hi_val, hi_pos), (lo_val, lo_pos) = regs[hi], regs[lo]
+            if (imm_pos in [hi_pos, lo_pos]):
+                partner = lo_pos if hi_pos == imm_pos else hi_pos
+                pair = (('pair', partner - imm_pos), (hi_val << 8) | lo_val)
+                if (pair not in pairs):
+                    pairs.append(pair)
         
-        logging.info('Checking record {0:02X}:{1:04X}...'.format(r['bankA'], r['ptrA']))
+        if (op in block_ends):
+            break
+        pos += length
+    
+    # consecutive ld [hl+],a store little-endian pointers
+    for ix, st in enumerate(stores):
+        if (st is None or st[1] != imm_pos):
+            continue
+        candidates = []
+        if (ix > 0 and stores[ix - 1] is not None):
+            lo_val, lo_pos = stores[ix - 1]
+            candidates.append((('store', lo_pos - imm_pos), (st[0] << 8) | lo_val))
+        if (ix + 1 < len(stores) and stores[ix + 1] is not None):
+            hi_val, hi_pos = stores[ix + 1]
+            candidates.append((('store', hi_pos - imm_pos), (hi_val << 8) | st[0]))
+        for pair in candidates:
+            if (pair not in pairs):
+                pairs.append(pair)
+
+def trackImmediates(data, imm_pos):
+    
+    # the differing byte must be the operand of ld r,n
+    op_pos = imm_pos - 1
+    if (op_pos < 0 or imm_pos >= len(data)):
+        return []
+    op = data[op_pos]
+    if (op & 0xC7 != 0x06 or op == 0x36):
+        return []
+    
+    pairs = []
+    for start in findBlockStarts(data, op_pos):
+        simulateBlock(data, start, imm_pos, pairs)
+    return pairs
+
+def decodePtrTable(rom, address, length, fmt, refBank):
+    
+    # stride slices pull every low, high and bank byte column out at once
+    size = len(fmt)
+    data = getRange(rom, address, length - length % size)
+    lows = data[fmt.index('l')::size]
+    highs = data[fmt.index('h')::size]
+    if ('b' in fmt):
+        banks = data[fmt.index('b')::size]
+    else:
+        banks = bytes([refBank]) * len(lows)
+    return [(b, (h << 8) | l) for b, h, l in zip(banks, highs, lows)]
+
+RegionCacheInfo = namedtuple('RegionCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class RegionCache:
+    """Memoizes RevisionDiff.infoAt per info region instead of per address.
+    
+    Records are checked in address order, so neighbouring records usually
+    fall into the region matched last in their bank. That region is tried
+    first, unless it overlaps another region and first-match order matters.
+    """
+    
+    def __init__(self, lookup, info_index):
+        
+        self.lookup = lookup
+        self.info_index = info_index
+        self.hits = 0
+        self.misses = 0
+        self.cache_clear()
+    
+    def cache_clear(self):
+        
+        self.last = {}
+        self.overlapping = None
+    
+    def cache_info(self):
+        
+        # one region is remembered per bank, there is no bound to report
+        return RegionCacheInfo(self.hits, self.misses, None, len(self.last))
+    
+    def findOverlapping(self):
+        
+        # regions sorted by start overlap a neighbour if an earlier one ends
+        # at or after their start, or the next one starts at or before their end
+        overlapping = set()
+        for entries in self.info_index.values():
+            entries = sorted(entries, key=lambda i: i['ptr'])
+            top = None
+            for ix, i in enumerate(entries):
+                end = i['ptr'] + i['len']
+                if ((top is not None and top >= i['ptr']) or \
+                    (ix + 1 < len(entries) and entries[ix + 1]['ptr'] <= end)):
+                    overlapping.add(id(i))
+                top = end if top is None else max(top, end)
+        return overlapping
+    
+    def __call__(self, bank, ptr):
+        
+        if (self.overlapping is None):
+            self.overlapping = self.findOverlapping()
+        i = self.last.get(bank)
+        if (i is not None and i['ptr'] <= ptr <= i['ptr'] + i['len']):
+            self.hits += 1
+            return i
+        self.misses += 1
+        i = self.lookup(bank, ptr)
+        if (i['type'] is not None and id(i) not in self.overlapping):
+            self.last[bank] = i
+        return i
+
+class Tracer:
+    """Per-record timings, rules and lookup counts collected by RevisionDiff.filter.
+    
+    Only attached with RevisionDiff.enableTracing, an untraced filter run
+    pays for a single None check per record.
+    """
+    
+    def __init__(self):
+        
+        self.start = time.perf_counter()
+        self.events = []
+        self.counts = {'shift': 0, 'ram shift': 0, 'info': 0}
+        self.steps = []
+    
+    def wrap(self, name, lookup):
+        
+        counts = self.counts
+        def counted(*args):
+            counts[name] += 1
+            return lookup(*args)
+        return counted
+    
+    def addStep(self, label):
+        
+        self.steps.append(label)
+        return len(self.steps) - 1
+    
+    def trace(self, session, r):
+        
+        before = dict(self.counts)
+        start = time.perf_counter()
+        rule = session.classify(r)
+        end = time.perf_counter()
+        counts = {name: self.counts[name] - before[name] for name in self.counts}
+        # the class method skips the counting and memoizing wrappers
+        info = RevisionDiff.infoAt(session, r['bankA'], r['ptrA'])
+        self.events.append({
+            'step'  : session.trace_step,
+            'bank'  : r['bankA'],
+            'ptr'   : r['ptrA'],
+            'rule'  : rule,
+            'info'  : info,
+            'start' : start - self.start,
+            'time'  : end - start,
+            'counts': counts,
+            }
+        )
+        return rule
+    
+    def slowest(self, count):
+        return sorted(self.events, key=lambda e: e['time'], reverse=True)[:count]
+    
+    def writeChrome(self, path):
+        
+        # trace event format, complete events in microseconds
+        events = []
+        for pid, label in enumerate(self.steps):
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': label}})
+        for e in self.events:
+            args = {'rule': e['rule'] or 'interesting', 'info': e['info']['type'] or 'none'}
+            args.update(('{0:s} lookups'.format(name), count) for name, count in e['counts'].items())
+            events.append({
+                'name': '{0:02X}:{1:04X}'.format(e['bank'], e['ptr']),
+                'cat' : args['rule'],
+                'ph'  : 'X',
+                'ts'  : e['start'] * 1e6,
+                'dur' : e['time'] * 1e6,
+                'pid' : e['step'],
+                'tid' : 0,
+                'args': args,
+                }
+            )
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    
+    def writeCollapsed(self, path):
+        
+        # step;bank;info region;rule with the summed microseconds, for flamegraph.pl
+        stacks = {}
+        for e in self.events:
+            info = e['info']
+            region = 'no info'
+            if (info['type'] is not None):
+                region = '{0:s} {1:02X}:{2:04X}'.format(info['type'], info['bank'], info['ptr'])
+            stack = ';'.join([self.steps[e['step']], 'bank {0:02X}'.format(e['bank']), region, e['rule'] or 'interesting'])
+            stacks[stack] = stacks.get(stack, 0) + e['time']
+        with open(path, 'w') as f:
+            for stack in sorted(stacks):
+                f.write('{0:s} {1:d}\n'.format(stack, max(1, int(round(stacks[stack] * 1e6)))))
+
+class RevisionDiff:
+    """Comparison of two ROM revisions, kept in memory for repeated queries.
+    
+    Holds both ROMs, the compare records with their shifts, the info entries
+    and the RAM shifts/remaps, plus indices over them, so addresses can be
+    translated and records classified without reparsing any input file.
+    """
+    
+    def __init__(self, romA, romB, info, compare, ramshift, romtype='', lru_size=0):
         
+        self.romA = romA
+        self.romB = romB
+        self.romtype = romtype
+        self.records, self.shifts, self.insertions, self.deletions = compare
+        self.ram_shifts, self.ram_deletions, self.ram_switches = ramshift
+        self.shift_index = buildShiftIndex(self.shifts)
+        self.ram_index = buildShiftIndex(self.ram_shifts, 'bank', 'ptr')
+        self.remaps = {(s['ptrA'], s['ptrB']) for s in self.ram_switches}
+        self.symbols = []
+        self.sym_banks = {}
+        self.moves = []
+        self.move_starts = []
+        self.dataflow = False
+        self.ptrtbl_engine = False
+        self.ptrtbl_verdicts = {}
+        self.filtered = []
+        self.tracer = None
+        self.trace_step = 0
+        self.info = []
+        self.info_index = {}
+        self.lookups = []
+        for i in info:
+            self.addInfo(i)
+        
+        if (lru_size):
+            self.shift = lru_cache(maxsize=lru_size)(self.shift)
+            self.ramShift = lru_cache(maxsize=lru_size)(self.ramShift)
+            self.infoAt = RegionCache(self.infoAt, self.info_index)
+            self.lookups = [('shift', self.shift), ('ram shift', self.ramShift), ('info', self.infoAt)]
+    
+    @classmethod
+    def fromFiles(cls, romtype, versionA, versionB, cache=False, jobs=1, lru_size=0, lazy=False, info=None):
+        
+        romnameA = '{0:s}{1:s}.gbc'.format(romtype, versionA)
+        romnameB = '{0:s}{1:s}.gbc'.format(romtype, versionB)
+        csvname = getPairFile(romtype, versionA, versionB, 'compare')
+        infoname = '{0:s}{1:s}_info.txt'.format(romtype, versionA)
+        ramshiftname = getPairFile(romtype, versionA, versionB, 'ramshift')
+        
+        stages = [
+            ('rom A',    readRom,        [romnameA, lazy],     True),
+            ('rom B',    readRom,        [romnameB, lazy],     True),
+            ('compare',  loadCompare,    [csvname, cache],     False),
+            ('ramshift', parseRamShifts, [ramshiftname],       False),
+            ]
+        # info entries may be handed over, e.g. translated from a previous step
+        if (info is None):
+            stages.insert(2, ('info', loadInfo, [infoname, cache], False))
+        results = loadStages(stages, jobs)
+        if (info is None):
+            info = results['info']
+        return cls(results['rom A'], results['rom B'], info, results['compare'], results['ramshift'], romtype, lru_size)
+    
+    def enableTracing(self, tracer, label=''):
+        
+        # count lookups through the instance, classify picks the wrappers up
+        self.tracer = tracer
+        self.trace_step = tracer.addStep(label or self.romtype)
+        self.shift = tracer.wrap('shift', self.shift)
+        self.ramShift = tracer.wrap('ram shift', self.ramShift)
+        self.infoAt = tracer.wrap('info', self.infoAt)
+    
+    def addInfo(self, entry):
+        
+        # info entries may also be given as lines in info file format
+        if (isinstance(entry, str)):
+            entry, _ = parseInfoLine(entry)
+            if (entry is None):
+                return None
+        self.info.append(entry)
+        self.info_index.setdefault(entry['bank'], []).append(entry)
+        for name, lookup in self.lookups:
+            if (name == 'info'):
+                lookup.cache_clear()
+        return entry
+    
+    def addSymbols(self, symbols):
+        
+        self.symbols = sorted(self.symbols + symbols, key=lambda s: (s['bank'], s['ptr']))
+        self.sym_banks = buildSymbolBanks(self.symbols)
+    
+    def findMoves(self, window):
+        
+        self.moves = detectMoves(self.romA, self.romB, self.deletions, self.insertions, window)
+        self.move_starts = [getAddress(m['bankA'], m['ptrA']) for m in self.moves]
+        self.ptrtbl_verdicts = {}
+        self.deletions = [d for d in self.deletions if not isCovered(d, 'bankA', 'ptrA', self.moves)]
+        self.insertions = [i for i in self.insertions if not isCovered(i, 'bankB', 'ptrB', self.moves)]
+        return self.moves
+    
+    def shift(self, bank, ptr):
+        return lookupShift(self.shift_index, bank, ptr)
+    
+    def ramShift(self, ptr):
+        return lookupShift(self.ram_index, 0, ptr)
+    
+    def infoAt(self, bank, ptr):
+        
+        for i in self.info_index.get(bank, []):
+            if i['ptr'] > ptr or i['ptr'] + i['len'] < ptr:
+                continue
+            return i
+        
+        return {'type': None}
+    
+    def isRemap(self, ptrA, ptrB):
+        return (ptrA, ptrB) in self.remaps
+    
+    def isMoved(self, bank, ptrA, ptrB):
+        return bool(self.moves) and isMoved(self.moves, self.move_starts, bank, ptrA, ptrB)
+    
+    def verifyPtrTable(self, entry):
+        
+        # decode the whole table in both revisions and judge every pointer once
+        key = (entry['bank'], entry['ptr'], entry['len'], entry['fmt'], entry['refBank'])
+        if (key in self.ptrtbl_verdicts):
+            return self.ptrtbl_verdicts[key]
+        
+        bankB, ptrB = self.translate(entry['bank'], entry['ptr'])
+        tableA = decodePtrTable(self.romA, getAddress(entry['bank'], entry['ptr']), entry['len'], entry['fmt'], entry['refBank'])
+        tableB = decodePtrTable(self.romB, getAddress(bankB, ptrB), entry['len'], entry['fmt'], entry['refBank'])
+        verdicts = []
+        for (bankA, addrA), (bankB, addrB) in zip(tableA, tableB):
+            # translate follows moves and targets shifted into the next bank,
+            # tables without bank bytes can only keep the pointer
+            targetBank, targetPtr = self.translate(bankA, addrA)
+            ok = (targetPtr == addrB and (targetBank == bankB or 'b' not in entry['fmt']))
+            verdicts.append((bankA, addrA, bankB, addrB, ok))
+        
+        self.ptrtbl_verdicts[key] = verdicts
+        return verdicts
+    
+    def translate(self, bank, ptr):
+        
+        if (ptr >= 0x8000):
+            for s in self.ram_switches:
+                if (s['ptrA'] == ptr):
+                    return bank, s['ptrB']
+            return bank, ptr + self.ramShift(ptr)
+        
+        address = getAddress(bank, ptr)
+        m = findMove(self.moves, self.move_starts, address)
+        if (m is not None):
+            address += getAddress(m['bankB'], m['ptrB']) - getAddress(m['bankA'], m['ptrA'])
+            return getBank(address), getPointer(address)
+        address += self.shift(bank, ptr)
+        return getBank(address), getPointer(address)
+    
+    def classify(self, r):
+        """Return the rule explaining record r, or None if it is interesting."""
+        
+        romA = self.romA
+        romB = self.romB
         pre3A, pre3B = getBytes(romA, romB, r, -3)
         pre2A, pre2B = getBytes(romA, romB, r, -2)
         preA, preB = getBytes(romA, romB, r, -1)
@@ -385,7 +1320,7 @@ def main():
         nextA, nextB = getBytes(romA, romB, r, +1)
         next2A, next2B = getBytes(romA, romB, r, +2)
         next3A, next3B = getBytes(romA, romB, r, +3)
-        r_info = getInfo(info, r['bankA'], r['ptrA'])
+        r_info = self.infoAt(r['bankA'], r['ptrA'])
         
         logging.debug('    Infotype: {0!s}'.format(r_info['type']))
         
@@ -422,30 +1357,37 @@ def main():
                 bank = r['bankA']
                 if (r_info['type'] != 'code'):
                     if (0 == r['bankA'] and called_addrA >= 0x4000):
-                        logging.warning('    call: out of bank call rom A.')
-                        continue
-                    if (0 == r['bankB'] and called_addrB >= 0x4000):
+                        bank = getSymbolBank(self.sym_banks, called_addrA)
+                        if (bank is None):
+                            logging.warning('    call: out of bank call rom A.')
+                            return 'call-skip'
+                        logging.debug('    call: symbol hint bank {0:02X}'.format(bank))
+                    elif (0 == r['bankB'] and called_addrB >= 0x4000):
                         logging.warning('    call: out of bank call rom B but not rom A!')
-                        continue
+                        return 'call-skip'
                 else:
                     bank = r_info['refBank']
-                shift = sumShifts(shifts, bank, called_addrA)
+                shift = self.shift(bank, called_addrA)
                 logging.debug('    call: shift {0:04X}'.format(shift))
                 if (called_addrA + shift == called_addrB):
-                    continue
+                    return 'call'
+                if (self.isMoved(bank, called_addrA, called_addrB)):
+                    return 'call-move'
         
         # check if long call rst $0 0xC7 (DDS-specific)
-        if (romtype == 'aka' or romtype == 'kuro'):
+        if (self.romtype == 'aka' or self.romtype == 'kuro'):
             if (0xC7 == pre2A and 0xC7 == pre2B):
                 if (preA == preB and nextA is not None and nextB is not None):
                     called_addrA = (nextA << 8) | curA
                     called_addrB = (nextB << 8) | curB
                     logging.debug('    longcall: {0:02X}:{1:04X} -- {2:02X}:{3:04X}'.format(preA, called_addrA, preB, called_addrB))
                     
-                    shift = sumShifts(shifts, preA, called_addrA)
+                    shift = self.shift(preA, called_addrA)
                     logging.debug('    longcall: shift {0:04X}'.format(shift))
                     if (called_addrA + shift == called_addrB):
-                        continue
+                        return 'longcall'
+                    if (self.isMoved(preA, called_addrA, called_addrB)):
+                        return 'longcall-move'
         
         # check if ld [$NNNN], a
         # check if ld a, [$NNNN]
@@ -479,24 +1421,29 @@ def main():
                     bank = r['bankA']
                     if (r_info['type'] != 'code' and target == 'rom'):
                         if (0 == r['bankA'] and loaded_addrA >= 0x4000):
-                            logging.warning('    loadstore: out of bank access rom A.')
-                            continue
-                        if (0 == r['bankB'] and loaded_addrB >= 0x4000):
+                            bank = getSymbolBank(self.sym_banks, loaded_addrA)
+                            if (bank is None):
+                                logging.warning('    loadstore: out of bank access rom A.')
+                                return 'loadstore-skip'
+                            logging.debug('    loadstore: symbol hint bank {0:02X}'.format(bank))
+                        elif (0 == r['bankB'] and loaded_addrB >= 0x4000):
                             logging.warning('    loadstore: out of bank access rom B but not rom A!')
-                            continue
+                            return 'loadstore-skip'
                     elif (r_info['type'] == 'code'):
                         bank = r_info['refBank']
                     
                     if (target == 'rom'):
-                        shift = sumShifts(shifts, bank, loaded_addrA)
+                        shift = self.shift(bank, loaded_addrA)
                     else:
                         # target == 'ram'
-                        shift = sumRamShifts(ram_shifts, 0, loaded_addrA)
-                        if (isRamRemap(ram_switches, loaded_addrA, loaded_addrB)):
-                            continue
+                        shift = self.ramShift(loaded_addrA)
+                        if (self.isRemap(loaded_addrA, loaded_addrB)):
+                            return 'loadstore-remap'
                     logging.debug('    loadstore: {1:s} shift {0:04X}'.format(shift, target))
                     if (loaded_addrA + shift == loaded_addrB):
-                        continue
+                        return 'loadstore'
+                    if (target == 'rom' and self.isMoved(bank, loaded_addrA, loaded_addrB)):
+                        return 'loadstore-move'
         
         # check if ld a,[$FF00 + $N]
         # check if ld [$FF00 + $N], a
@@ -512,15 +1459,30 @@ def main():
                 loaded_addrA = 0xFF00 | curA
                 loaded_addrB = 0xFF00 | curB
                 logging.debug('    loadstore: {0:04X} -- {1:04X}'.format(loaded_addrA, loaded_addrB))
-                shift = sumRamShifts(ram_shifts, 0, loaded_addrA)
-                if (isRamRemap(ram_switches, loaded_addrA, loaded_addrB)):
-                    continue
+                shift = self.ramShift(loaded_addrA)
+                if (self.isRemap(loaded_addrA, loaded_addrB)):
+                    return 'hram-remap'
                 logging.debug('    loadstore: {1:s} shift {0:04X}'.format(shift, 'ram'))
                 if (loaded_addrA + shift == loaded_addrB):
-                    continue
+                    return 'hram'
+        
+        # check if ptr-table entries all still point to their shifted targets
+        decoded = False
+        if (r_info['type'] == 'ptrtbl' and self.ptrtbl_engine):
+            verdicts = self.verifyPtrTable(r_info)
+            offset = getAddress(r['bankA'], r['ptrA']) - getAddress(r_info['bank'], r_info['ptr'])
+            fmt_len = len(r_info['fmt'])
+            first = offset // fmt_len
+            last = (offset + max(r['lenA'], 1) - 1) // fmt_len
+            decoded = (0 <= first and last < len(verdicts))
+            if (decoded):
+                for bankA, addrA, bankB, addrB, ok in verdicts[first:last + 1]:
+                    logging.debug('    ptrtbl: {0:02X}:{1:04X} -- {2:02X}:{3:04X}'.format(bankA, addrA, bankB, addrB))
+                if (all(v[4] for v in verdicts[first:last + 1])):
+                    return 'ptrtbl'
         
         # check if ptr-table
-        if (r_info['type'] == 'ptrtbl'):
+        if (r_info['type'] == 'ptrtbl' and not decoded):
             banks = r['bankA'] - r_info['bank']
             diff = r['ptrA'] - r_info['ptr']
             offset = banks * banksize + diff
@@ -548,10 +1510,34 @@ def main():
                 if ('b' in fmt):
                     bankA = dataB[(byte_shift + off['b']) % fmt_len]
                 logging.debug('    ptrtbl: {0:04X} -- {1:04X}'.format(ptrAddrA, ptrAddrB))
-                shift = sumShifts(shifts, bankA, ptrAddrA)
+                shift = self.shift(bankA, ptrAddrA)
                 logging.debug('    ptrtbl: shift {0:04X}'.format(shift))
                 if (ptrAddrA + shift == ptrAddrB):
+                    return 'ptrtbl'
+                if (self.isMoved(bankA, ptrAddrA, ptrAddrB)):
+                    return 'ptrtbl-move'
+        
+        # check if split 8-bit immediates form a pointer within the basic block
+        if (self.dataflow and r['lenA'] == 1 and r['lenB'] == 1 and r['bankB'] in romB):
+            pairsB = dict(trackImmediates(romB[r['bankB']], r['ptrB'] & 0x3FFF))
+            for key, addrA in trackImmediates(romA[r['bankA']], r['ptrA'] & 0x3FFF):
+                if (key not in pairsB):
+                    continue
+                addrB = pairsB[key]
+                logging.debug('    splitptr: {0:s} {1:04X} -- {2:04X}'.format(key[0], addrA, addrB))
+                if (addrA >= 0x8000):
+                    if (self.isRemap(addrA, addrB) or addrA + self.ramShift(addrA) == addrB):
+                        return 'splitptr'
                     continue
+                bank = r['bankA']
+                if (r_info['type'] == 'code'):
+                    bank = r_info['refBank']
+                elif (0 == r['bankA'] and addrA >= 0x4000):
+                    bank = getSymbolBank(self.sym_banks, addrA)
+                    if (bank is None):
+                        continue
+                if (addrA + self.shift(bank, addrA) == addrB or self.isMoved(bank, addrA, addrB)):
+                    return 'splitptr'
         
         if (r_info['type'] == 'ptradd'):
         
@@ -578,35 +1564,127 @@ def main():
                     if (offset == 4):
                         ptrAddrAlo, ptrAddrBlo = pre3A, pre3B
                         ptrAddrAhi, ptrAddrBhi = curA, curB
+                
+                # only the bytes of the pointer itself have to be in the bank
+                if (offset in [1, 4] and None not in [ptrAddrAlo, ptrAddrBlo, ptrAddrAhi, ptrAddrBhi]):
                     
-                    prtAddrA = (ptrAddrAhi << 8) | (ptrAddrAlo)
-                    prtAddrB = (ptrAddrBhi << 8) | (ptrAddrBlo)
+                    ptrAddrA = (ptrAddrAhi << 8) | (ptrAddrAlo)
+                    ptrAddrB = (ptrAddrBhi << 8) | (ptrAddrBlo)
                     logging.debug('    ptradd: {0:04X} -- {1:04X}'.format(ptrAddrA, ptrAddrB))
-                    shift = sumShifts(shifts, bank, ptrAddrA)
+                    shift = self.shift(bank, ptrAddrA)
                     logging.debug('    ptradd: shift {0:04X}'.format(shift))
                     if (ptrAddrA + shift == ptrAddrB):
-                        continue
-                
-        logging.info('    Interesting...')
-        records_filtered.append(r)
-
-    logging.info('------------------------------------------------------------------------')
-    logging.info('filtered/unfiltered {0:d}/{1:d}'.format(len(records_filtered), len(records)))
-
-    # mix everything together
-    # insertions, deletions, filtered records
-
-    for e in insertions:
-        e['type'] = 'Insertion'
-    for e in deletions:
-        e['type'] = 'Deletion'
-    for e in records_filtered:
-        e['type'] = 'Difference'
-
-    all_records = insertions + deletions + records_filtered
-
-    all_records = sorted(all_records, key=lambda entry: entry['bankA'] * banksize | (entry['ptrA'] & 0x3FFF))
+                        return 'ptradd'
+        
+        return None
+    
+    def filter(self):
+        
+        filter_start = time.perf_counter()
+        self.filtered = []
+        for r in self.records:
+            logging.info('Checking record {0:02X}:{1:04X}...'.format(r['bankA'], r['ptrA']))
+            if (self.tracer is not None):
+                rule = self.tracer.trace(self, r)
+            else:
+                rule = self.classify(r)
+            if (rule is None):
+                logging.info('    Interesting...')
+                self.filtered.append(r)
+        
+        logging.info('------------------------------------------------------------------------')
+        logging.info('filtered/unfiltered {0:d}/{1:d}'.format(len(self.filtered), len(self.records)))
+        perf.debug('Filtering: {0:.3f}s for {1:d} records'.format(time.perf_counter() - filter_start, len(self.records)))
+        return self.filtered
+    
+    def results(self):
+        
+        # mix everything together
+        # insertions, deletions, filtered records
+        
+        for e in self.insertions:
+            e['type'] = 'Insertion'
+        for e in self.deletions:
+            e['type'] = 'Deletion'
+        for e in self.filtered:
+            e['type'] = 'Difference'
+        for e in self.moves:
+            e['type'] = 'Move'
+        
+        all_records = self.insertions + self.deletions + self.filtered + self.moves
+        
+        return sorted(all_records, key=lambda entry: entry['bankA'] * banksize | (entry['ptrA'] & 0x3FFF))
+    
+    def cluster(self, distance):
+        
+        # results are sorted by A address, so one sweep merges each entry
+        # into the open group if it is close enough or shares its info region
+        clusters = []
+        for r in self.results():
+            startA = getAddress(r['bankA'], r['ptrA'])
+            startB = getAddress(r['bankB'], r['ptrB'])
+            endA = startA + (0 if r['type'] == 'Insertion' else r.get('lenA', r.get('len', 0)))
+            endB = startB + (0 if r['type'] == 'Deletion' else r.get('lenB', r.get('len', 0)))
+            # bypass the memo, the lookup statistics only cover the filter
+            region = RevisionDiff.infoAt(self, r['bankA'], r['ptrA'])
+            if (region['type'] is None):
+                region = None
+            c = clusters[-1] if clusters else None
+            if (c is not None and (startA - c['endA'] <= distance or (region is not None and region is c['region']))):
+                c['endA'] = max(c['endA'], endA)
+                c['startB'] = min(c['startB'], startB)
+                c['endB'] = max(c['endB'], endB)
+                c['records'].append(r)
+                if (region is not None):
+                    c['region'] = region
+                continue
+            clusters.append({
+                'startA' : startA,
+                'endA'   : endA,
+                'startB' : startB,
+                'endB'   : endB,
+                'region' : region,
+                'records': [r],
+                }
+            )
+        return clusters
+    
+    def dump(self):
+        
+        # print shifts:
+        shift = 0
+        for s in self.shifts:
+            logging.debug('Shift: {0:02X}:{1:04X} -- {2:d} --> {3:d}'.format(s['bankA'], s['ptrA'], shift, shift + s['shift']))
+            shift += s['shift']
+        
+        for i in self.insertions:
+            logging.debug('Insertion: {0:02X}:{1:04X} -- -{2:d}'.format(i['bankA'], i['ptrA'], i['len']))
+        
+        for d in self.deletions:
+            logging.debug('Deletion: {0:02X}:{1:04X} -- -{2:d}'.format(d['bankA'], d['ptrA'], d['len']))
+        
+        for m in self.moves:
+            logging.debug('Move: {0:02X}:{1:04X} -- {2:d} --> {3:02X}:{4:04X}'.format(m['bankA'], m['ptrA'], m['len'], m['bankB'], m['ptrB']))
+        
+        shift = 0
+        for s in self.ram_shifts:
+            logging.debug('RAM Shift: {0:02X}:{1:04X} -- {2:d} --> {3:d}'.format(s['bank'], s['ptr'], shift, shift + s['shift']))
+            shift += s['shift']
+        
+        for d in self.ram_deletions:
+            logging.debug('RAM Deletion: {0:04X} -- -{1:d}'.format(d['addr'], d['len']))
+    
+    def dumpInfo(self):
+        
+        # print infos:
+        for i in self.info:
+            logging.debug('Info: {0:02X}:{1:04X} -- {2:d} bytes ref bank {3:02X}'.format(i['bank'], i['ptr'], i['len'], i['refBank']))
+    
+    def lookupStats(self):
+        return [(name, lookup.cache_info()) for name, lookup in self.lookups]
 
+def logResults(all_records):
+    
     for r in all_records:
         lenA = r['len'] if 'len' in r else r['lenA']
         lenB = r['len'] if 'len' in r else r['lenB']
@@ -620,9 +1698,251 @@ def main():
             lenB
             )
         )
+    
+    logging.info('------------------------------------------------------------------------')
+
+def runStep(romtype, versionA, versionB, args, symfiles, symoutname, tracer=None, info=None):
+
+    csvname = getPairFile(romtype, versionA, versionB, 'compare')
+    ramshiftname = getPairFile(romtype, versionA, versionB, 'ramshift')
+    jobs = args.jobs
+    move_window = args.move_window if args.moves else 0
+
+    session = RevisionDiff.fromFiles(romtype, versionA, versionB, args.cache, jobs if args.parallel else 1, args.lru_size, args.lazy, info)
+    if (tracer is not None):
+        session.enableTracing(tracer, '{0:s}{1:s}v{2:s}'.format(romtype, versionA, versionB))
+
+    session.dataflow = args.dataflow
+    session.ptrtbl_engine = args.ptrtbl_engine
+    if (move_window):
+        session.findMoves(move_window)
+
+    session.dump()
+
+    for symfile in symfiles:
+        session.addSymbols(loadSymbols(symfile))
+    
+    if (session.symbols):
+        romnames = ['{0:s}{1:s}.gbc'.format(romtype, version) for version in [versionA, versionB]]
+        digest = getSymbolsDigest(symfiles + [csvname, ramshiftname] + romnames, move_window)
+        if (isUpToDate(symoutname, digest)):
+            logging.debug('Symbols: {0:s} is up to date'.format(symoutname))
+        else:
+            writeSymbols(symoutname, translateSymbols(session.symbols, session.translate), digest)
+            logging.debug('Symbols: translated {0:d} symbols to {1:s}'.format(len(session.symbols), symoutname))
+
+    session.dumpInfo()
+
+    if (args.bank_hash):
+        banks = classifyBanks(session.romA, session.romB, session.shifts, jobs)
+        for bank in sorted(banks):
+            b = banks[bank]
+            if (b['state'] == 'shifted'):
+                perf.info('Bank {0:02X}: shifted by {1:d}'.format(bank, b['shift']))
+            elif (b['state'] == 'changed'):
+                perf.info('Bank {0:02X}: changed, {1:d}/{2:d} blocks differ'.format(bank, len(b['blocks']), banksize // blocksize))
+            elif (b['state'] != 'identical'):
+                perf.info('Bank {0:02X}: {1:s}'.format(bank, b['state']))
+        unchanged = {bank for bank, b in banks.items() if b['state'] in ['identical', 'shifted']}
+        perf.info('Banks: {0:d} unchanged, {1:d} to inspect'.format(len(unchanged), len(banks) - len(unchanged)))
+
+    session.filter()
+    logResults(session.results())
+    if (args.cluster is not None):
+        logClusters(session.cluster(args.cluster), len(session.records))
+    
+    for name, rom in [('A', session.romA), ('B', session.romB)]:
+        if (isinstance(rom, LazyRom)):
+            perf.debug('Banks read from ROM {0:s}: {1:d}/{2:d}'.format(name, len(rom.banks), len(rom)))
+    
+    for name, stats in session.lookupStats():
+        total = stats.hits + stats.misses
+        if (stats.maxsize is None):
+            entries = '{0:d} entries'.format(stats.currsize)
+        else:
+            entries = '{0:d}/{1:d} entries'.format(stats.currsize, stats.maxsize)
+        perf.info('LRU {0:s}: {1:d} hits, {2:d} misses ({3:.1f}% hit rate), {4:s}'.format(
+            name,
+            stats.hits,
+            stats.misses,
+            100.0 * stats.hits / total if total else 0.0,
+            entries
+            )
+        )
+    return session
+
+def logChain(romtype, versions, sessions):
+
+    # suffixes[k] maps ROM B of step k straight to the last revision
+    suffixes = [[]]
+    for session in reversed(sessions[1:]):
+        suffixes.insert(0, composeShifts(session.shifts, suffixes[0]))
+    composed = composeShifts(sessions[0].shifts, suffixes[0])
+    
+    shift = 0
+    for s in composed:
+        logging.debug('Composed shift: {0:02X}:{1:04X} -- {2:d} --> {3:d}'.format(s['bankA'], s['ptrA'], shift, shift + s['shift']))
+        shift += s['shift']
+    
+    # every surviving change, placed in the last revision
+    changes = []
+    for k, session in enumerate(sessions):
+        index = buildShiftIndex(suffixes[k])
+        for r in session.results():
+            address = getAddress(r['bankB'], r['ptrB']) + lookupShift(index, r['bankB'], r['ptrB'])
+            changes.append((address, k, r))
+    
+    last = versions[-1]
+    logging.info('End to end {0:s}{1:s} -> {0:s}{2:s}'.format(romtype, versions[0], last))
+    logging.info('------------------------------------------------------------------------')
+    for address, k, r in sorted(changes, key=lambda c: (c[0], c[1])):
+        lenA = r['len'] if 'len' in r else r['lenA']
+        logging.info('{0:12s} in {1:s}v{2:s} at {1:s} {3:02X}:{4:04X} - {5:2d} -- {6:s}: {7:02X}:{8:04X}'.format(
+            r['type'],
+            versions[k],
+            versions[k + 1],
+            r['bankA'],
+            r['ptrA'],
+            lenA,
+            last,
+            getBank(address),
+            getPointer(address)
+            )
+        )
+    
+    logging.info('------------------------------------------------------------------------')
+    logging.info('changes per step {0:s}, end to end {1:d}'.format('/'.join(str(len(session.results())) for session in sessions), len(changes)))
 
+def logClusters(clusters, total):
+    
+    for ix, c in enumerate(clusters):
+        counts = {}
+        for r in c['records']:
+            counts[r['type']] = counts.get(r['type'], 0) + 1
+        logging.info('Change {0:3d} at A {1:02X}:{2:04X} - {3:02X}:{4:04X} -- B: {5:02X}:{6:04X} - {7:02X}:{8:04X} -- {9:s}'.format(
+            ix + 1,
+            getBank(c['startA']),
+            getPointer(c['startA']),
+            getBank(c['endA']),
+            getPointer(c['endA']),
+            getBank(c['startB']),
+            getPointer(c['startB']),
+            getBank(c['endB']),
+            getPointer(c['endB']),
+            ', '.join('{0:s} x{1:d}'.format(t, counts[t]) for t in sorted(counts))
+            )
+        )
+    
     logging.info('------------------------------------------------------------------------')
+    logging.info('{0:d} differences trimmed to {1:d} principal changes'.format(total, len(clusters)))
+
+def main():
+
+    ap = argparse.ArgumentParser(description='Filter out bogus diffs from revision comparisons by tracking address shifts',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--debug', dest='debug', default=False, help='print debug output', action='store_true')
+    ap.add_argument('romtype', help='ROM type: aka, kuro')
+    ap.add_argument('versionA', help='ROM A version string')
+    ap.add_argument('versionB', help='ROM B version string')
+    ap.add_argument('outfile', nargs='?', help='path to trimmed output diff file')
+    ap.add_argument('--sym', dest='symfiles', action='append', default=[], help='RGBDS .sym/.map file for ROM A (may be repeated)')
+    ap.add_argument('--symout', dest='symout', default=None, help='path to translated symbol file for ROM B (default: <game><A>v<B>_translated.sym)')
+    ap.add_argument('--bank-hash', dest='bank_hash', default=False, help='hash banks of both ROMs up front and print which of them changed', action='store_true')
+    ap.add_argument('--moves', dest='moves', default=False, help='detect blocks moved between deletions and insertions', action='store_true')
+    ap.add_argument('--move-window', dest='move_window', type=int, default=16, help='minimum size of moved blocks (default: 16)')
+    ap.add_argument('--dataflow', dest='dataflow', default=False, help='track split 8-bit immediates that form pointers', action='store_true')
+    ap.add_argument('--ptrtbl-engine', dest='ptrtbl_engine', default=False, help='decode whole pointer tables, taking bank bytes from ROM A', action='store_true')
+    ap.add_argument('--lru-size', dest='lru_size', type=int, default=0, help='memoize up to N shift lookups each and info lookups per region (default: off)')
+    ap.add_argument('--parallel', dest='parallel', default=False, help='read ROMs while the input files are parsed', action='store_true')
+    ap.add_argument('--timing', dest='timing', default=False, help='print stage timings to the console', action='store_true')
+    ap.add_argument('--jobs', dest='jobs', type=int, default=None, help='number of worker threads (default: CPU count)')
+    ap.add_argument('--lazy', dest='lazy', default=False, help='read ROM banks only when they are first accessed', action='store_true')
+    ap.add_argument('--cache', dest='cache', default=False, help='keep parsed info and compare files in binary .cache sidecars', action='store_true')
+    ap.add_argument('--trace', dest='trace', default=None, metavar='PATH', help='write per-record timings as Chrome trace-event JSON')
+    ap.add_argument('--trace-collapsed', dest='trace_collapsed', default=None, metavar='PATH', help='write per-record timings as collapsed stacks for flamegraphs')
+    ap.add_argument('--cluster', dest='cluster', type=int, default=None, metavar='DISTANCE', help='group changes at most DISTANCE bytes apart or in the same info region')
+    ap.add_argument('--chain', dest='chain', action='append', default=[], metavar='VERSION', help='further revision after ROM B, compared step by step and end to end (may be repeated)')
+
+    args = ap.parse_args()
+    debug = args.debug
+    romtype = args.romtype
+    outname = args.outfile
+    versionA = args.versionA
+    versionB = args.versionB
+    symfiles = args.symfiles
+    versions = [versionA, versionB] + args.chain
+    
+    if outname is None:
+        outname = '{0:s}{2:s}v{3:s}_trimmed{1:s}.log'.format(romtype, '-debug' if debug else '', versionA, versions[-1])
+    
+    # the per-game files only describe one pair, every chain step needs its own
+    if (len(versions) > 2):
+        for vA, vB in zip(versions, versions[1:]):
+            for kind in ['compare', 'ramshift']:
+                pairname = getPairName(romtype, vA, vB, kind)
+                if (not os.path.exists(pairname)):
+                    ap.error('--chain needs {0:s} for step {1:s} -> {2:s}'.format(pairname, vA, vB))
+    
+    loglevel = logging.DEBUG if debug else logging.INFO
+    logging.basicConfig(format='[%(levelname)-8s] %(message)s', level=loglevel, filename=outname, filemode='w')
+    perf_handler = logging.StreamHandler(sys.stderr)
+    perf_handler.setFormatter(logging.Formatter('[%(levelname)-8s] %(message)s'))
+    perf.addHandler(perf_handler)
+    perf.setLevel(logging.DEBUG if args.timing else logging.INFO)
+    perf.propagate = False
+
+    # never overwrite a symbol file this script didn't write, e.g. ROM B's own
+    if (symfiles):
+        symoutnames = [getSymbolsName(romtype, vA, vB) for vA, vB in zip(versions, versions[1:])]
+        if (args.symout is not None):
+            symoutnames[-1] = args.symout
+        for name in symoutnames:
+            if (os.path.exists(name) and not isOwnSymbols(name)):
+                ap.error('{0:s} was not written by diff_trim.py, refusing to overwrite it'.format(name))
+    
+    tracer = None
+    if (args.trace or args.trace_collapsed):
+        tracer = Tracer()
+    
+    sessions = []
+    symoutname = None
+    for vA, vB in zip(versions, versions[1:]):
+        if (len(versions) > 2):
+            logging.info('Step {0:s}{1:s} -> {0:s}{2:s}'.format(romtype, vA, vB))
+            logging.info('------------------------------------------------------------------------')
+        # each step translates the symbols of its ROM A for the next one
+        if (sessions and symfiles):
+            symfiles = [symoutname]
+        symoutname = getSymbolsName(romtype, vA, vB)
+        if (vB == versions[-1] and args.symout is not None):
+            symoutname = args.symout
+        # intermediate revisions may lack an info file, carry the last one over
+        info = None
+        infoname = '{0:s}{1:s}_info.txt'.format(romtype, vA)
+        if (sessions and not os.path.exists(infoname)):
+            info = translateInfo(sessions[-1].info, sessions[-1].translate)
+            logging.debug('Info: {0:s} not found, translated {1:d} entries from the previous step'.format(infoname, len(info)))
+        sessions.append(runStep(romtype, vA, vB, args, symfiles, symoutname, tracer, info))
+    
+    if (len(versions) > 2):
+        logChain(romtype, versions, sessions)
+    
+    if (tracer is not None):
+        for e in tracer.slowest(5):
+            perf.info('Slow record {0:s} {1:02X}:{2:04X}: {3:.3f}ms, rule {4:s}, {5:s}'.format(
+                tracer.steps[e['step']],
+                e['bank'],
+                e['ptr'],
+                e['time'] * 1e3,
+                e['rule'] or 'interesting',
+                ', '.join('{0:d} {1:s}'.format(count, name) for name, count in sorted(e['counts'].items()))
+                )
+            )
+        if (args.trace):
+            tracer.writeChrome(args.trace)
+        if (args.trace_collapsed):
+            tracer.writeCollapsed(args.trace_collapsed)
     return 0
 
 if __name__ == '__main__':
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# #!/usr/bin/env python3
+# coding: utf-8
+
+import argparse
+import csv
+import logging
+import sys
+from re import compile, DOTALL
+
+from diff_trim import banksize, buildShiftIndex, getAddress, getBank, loadCompare, lookupShift, readRom
+
+# ld rr,$NNNN / ld [$NNNN],a / ld a,[$NNNN] and ldh [$FF00 + $N],a / ldh a,[$FF00 + $N]
+word_regex = compile(b'(?=[\x01\x11\x21\x31\xEA\xFA]..)', DOTALL)
+byte_regex = compile(b'(?=[\xE0\xF0].)', DOTALL)
+
+ram_regions = [(0xC000, 0xE000), (0xFF80, 0xFFFF)]
+
+def isRam(address):
+    return any(start <= address < end for start, end in ram_regions)
+
+def getOperand(data, pos):
+
+    op = data[pos]
+    if (op in [0xE0, 0xF0]):
+        return 0xFF00 | data[pos + 1]
+    return (data[pos + 2] << 8) | data[pos + 1]
+
+def collectAccesses(romA, romB, shift_index):
+
+    # the regexes find candidate opcodes in C, only RAM operands are paired up
+    accesses = {}
+    for bank, data in romA.items():
+        base = 0x4000 if bank else 0x0000
+        positions = [m.start() for m in word_regex.finditer(data)]
+        positions += [m.start() for m in byte_regex.finditer(data)]
+        for pos in positions:
+            ramA = getOperand(data, pos)
+            if (not isRam(ramA)):
+                continue
+            ptr = base | pos
+            address = getAddress(bank, ptr) + lookupShift(shift_index, bank, ptr)
+            dataB = romB.get(getBank(address))
+            posB = address % banksize
+            if (dataB is None or posB + 2 >= len(dataB) or dataB[posB] != data[pos]):
+                continue
+            ramB = getOperand(dataB, posB)
+            if (not isRam(ramB)):
+                continue
+            histogram = accesses.setdefault(ramA, {})
+            histogram[ramB] = histogram.get(ramB, 0) + 1
+    return accesses
+
+def inferDeltas(accesses, min_count):
+
+    deltas = {}
+    for ramA, histogram in accesses.items():
+        ramB, count = max(histogram.items(), key=lambda entry: (entry[1], -abs(entry[0] - ramA)))
+        if (count < min_count or 2 * count < sum(histogram.values())):
+            continue
+        deltas[ramA] = (ramB - ramA, count)
+    return deltas
+
+def alignLayouts(deltas, lookahead=2):
+
+    # sweep the addresses in order, switch the running shift when the following
+    # addresses agree on a new one, and keep lone outliers as remaps
+    changes = []
+    remaps = []
+    current = 0
+    for start, end in ram_regions:
+        if (current):
+            # shifts accumulate, so each region starts unshifted
+            changes.append((start, 0))
+            current = 0
+        addresses = sorted(a for a in deltas if start <= a < end)
+        for ix, address in enumerate(addresses):
+            delta = deltas[address][0]
+            if (delta == current):
+                continue
+            following = [deltas[a][0] for a in addresses[ix + 1:ix + 1 + lookahead]]
+            if (following.count(delta) == len(following)):
+                changes.append((address, delta))
+                current = delta
+            else:
+                remaps.append((address, address + delta))
+    return changes, remaps
+
+def writeRamShifts(path, changes, remaps):
+
+    with open(path, 'w', newline='') as f:
+        csvw = csv.writer(f, dialect='excel')
+        csvw.writerow(['Result', 'Address A', 'Size A', 'Address B', 'Size B'])
+        curA = ram_regions[0][0]
+        current = 0
+        for address, delta in changes:
+            diff = delta - current
+            if (diff > 0):
+                # bytes inserted in B in front of address
+                size = address - curA
+                csvw.writerow(['Match', '{0:X}h'.format(curA), '{0:X}h'.format(size), '{0:X}h'.format(curA + current), '{0:X}h'.format(size)])
+                csvw.writerow(['Only in B', '', '', '{0:X}h'.format(address + current), '{0:X}h'.format(diff)])
+            else:
+                # bytes deleted from A in front of address
+                size = max(0, address + diff - curA)
+                csvw.writerow(['Match', '{0:X}h'.format(curA), '{0:X}h'.format(size), '{0:X}h'.format(curA + current), '{0:X}h'.format(size)])
+                csvw.writerow(['Only in A', '{0:X}h'.format(address + diff), '{0:X}h'.format(-diff), '', ''])
+            curA = address
+            current = delta
+        for ramA, ramB in remaps:
+            csvw.writerow(['Remap', '{0:X}h'.format(ramA), '1h', '{0:X}h'.format(ramB), '1h'])
+
+def main():
+
+    ap = argparse.ArgumentParser(description='Propose WRAM/HRAM shifts and remaps from RAM accesses in both ROMs',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    ap.add_argument('--debug', dest='debug', default=False, help='print access histograms', action='store_true')
+    ap.add_argument('--min-count', dest='min_count', type=int, default=2, help='minimum number of matched accesses per address (default: 2)')
+    ap.add_argument('romtype', help='ROM type: aka, kuro')
+    ap.add_argument('versionA', help='ROM A version string')
+    ap.add_argument('versionB', help='ROM B version string')
+    ap.add_argument('outfile', nargs='?', help='path to proposed ramshift CSV file')
+
+    args = ap.parse_args()
+    romtype = args.romtype
+    outname = args.outfile
+
+    if outname is None:
+        outname = '{0:s}_ramshift_proposed.csv'.format(romtype)
+
+    loglevel = logging.DEBUG if args.debug else logging.INFO
+    logging.basicConfig(format='[%(levelname)-8s] %(message)s', level=loglevel)
+
+    romA = readRom('{0:s}{1:s}.gbc'.format(romtype, args.versionA))
+    romB = readRom('{0:s}{1:s}.gbc'.format(romtype, args.versionB))
+    records, shifts, insertions, deletions = loadCompare('{0:s}_compare.csv'.format(romtype))
+
+    accesses = collectAccesses(romA, romB, buildShiftIndex(shifts))
+    for ramA in sorted(accesses):
+        histogram = ', '.join('{0:04X} x{1:d}'.format(ramB, count) for ramB, count in sorted(accesses[ramA].items()))
+        logging.debug('RAM {0:04X}: {1:s}'.format(ramA, histogram))
+
+    deltas = inferDeltas(accesses, args.min_count)
+    changes, remaps = alignLayouts(deltas)
+    for address, delta in changes:
+        logging.info('Shift: {0:04X} --> {1:d}'.format(address, delta))
+    for ramA, ramB in remaps:
+        logging.info('Remap: {0:04X} --> {1:04X}'.format(ramA, ramB))
+
+    writeRamShifts(outname, changes, remaps)
+    logging.info('{0:d} accessed addresses, {1:d} matched, {2:d} shifts, {3:d} remaps written to {4:s}'.format(
+        len(accesses),
+        len(deltas),
+        len(changes),
+        len(remaps),
+        outname
+        )
+    )
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())